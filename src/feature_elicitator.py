@@ -100,7 +100,8 @@ class FeatureElicitator():
 		feat_range = [FEAT_RANGE[feat_list[feat]] for feat in range(len(feat_list))]
 		lf_dict = rospy.get_param("setup/LF_dict")
         # LF_dict = rospy.get_param("setup/LF_dict")
-		self.environment = Environment(model_filename, object_centers, feat_list, feat_range, np.array(weights), lf_dict)
+		device = rospy.get_param("setup/device", "cpu")
+		self.environment = Environment(model_filename, object_centers, feat_list, feat_range, np.array(weights), lf_dict, device=device)
 
 		# ----- Planner Setup ----- #
 		# Retrieve the planner specific parameters.
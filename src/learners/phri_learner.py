@@ -45,7 +45,7 @@ class PHRILearner(object):
 		betas = []
 		traj_deform = traj.deform(u_h, t, self.alpha, self.n)
 		new_features = self.environment.featurize(traj_deform.waypts)
-		Phi_p = np.array([sum(x) for x in new_features])
+		Phi_p = new_features.sum(axis=1)
 
 		# Update betas vector.
 		for i in feat_idx:
@@ -64,7 +64,7 @@ class PHRILearner(object):
 				u_p = np.reshape(u, (7,1))
 				waypts_deform_p = traj.deform(u_p, t, self.alpha, self.n).waypts
 				H_features = self.environment.featurize(waypts_deform_p, [i])[0]
-				Phi_H = sum(H_features)
+				Phi_H = H_features.sum()
 				cost = (Phi_H - Phi_p[i])**2
 				return cost
 
@@ -73,7 +73,7 @@ class PHRILearner(object):
 				u_p = np.reshape(u, (7,1))
 				waypts_deform_p = traj.deform(u_p, t, self.alpha, self.n).waypts
 				H_features = self.environment.featurize(waypts_deform_p, [i])[0]
-				Phi_H = sum(H_features)
+				Phi_H = H_features.sum()
 				cost = np.linalg.norm(u)**2 + lambda_u * (Phi_H - Phi_p[i])**2
 				return cost
 
@@ -83,7 +83,7 @@ class PHRILearner(object):
 
 			waypts_deform_p = traj.deform(u_h_star, t, self.alpha, self.n).waypts
 			H_features = self.environment.featurize(waypts_deform_p)
-			Phi_u_star = np.array([sum(x) for x in H_features])
+			Phi_u_star = H_features.sum(axis=1)
 			print("Phi_p: ", Phi_p[i])
 			print("Phi_p_H: ", Phi_u_star
 )
@@ -117,8 +117,8 @@ class PHRILearner(object):
 		traj_deform = traj.deform(u_h, t, self.alpha, self.n)
 		new_features = self.environment.featurize(traj_deform.waypts)
 		old_features = self.environment.featurize(traj.waypts)
-		Phi_p = np.array([sum(x) for x in new_features])
-		Phi = np.array([sum(x) for x in old_features])
+		Phi_p = new_features.sum(axis=1)
+		Phi = old_features.sum(axis=1)
 		update = Phi_p - Phi
 
 		if self.feat_method == "all":
@@ -157,7 +157,7 @@ class TrajoptPlanner(object):
 				z = self.environment.feature_func_list[feat_idx](self.environment.raw_features(inter_waypt).float(), torchify=True)
 				feat_val = feat_val + z
 			y = feat_val / torch.tensor(float(NUM_STEPS), requires_grad=True)
-			y = y * torch.tensor(self.environment.weights[-n_learned+i:], requires_grad=True) * torch.norm(x[7:] - x[:7])
+			y = y * torch.tensor(self.environment.weights[-n_learned+i:], requires_grad=True, device=y.device) * torch.norm(x[7:] - x[:7]).to(y.device)
 			y.backward()
 			J.append(x.grad.data.numpy())
 		return np.sum(np.array(J), axis = 0).reshape((1,-1))
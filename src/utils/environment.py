@@ -7,17 +7,170 @@ from openravepy import *
 from openrave_utils import *
 from learned_feature import LearnedFeature
 
+# These are robot measurements and DH parameters.
+# Ds are link distances. es are some minor joint displacement errors.
+# For each transform, we much be careful which D and/or e we pass in.
+# The manual is sort of correct about how to do this but not 100% right.
+# Contact abobu@berkeley.edu if you have questions about this code.
+E_DH = torch.tensor([0.0016, 0.0098], dtype=torch.float64)
+D_DH = torch.tensor([0.15675, 0.11875, 0.205, 0.205, 0.2073, 0.10375, 0.10375], dtype=torch.float64)
+ALPHA_DH = torch.tensor([math.pi/2, math.pi/2, math.pi/2, math.pi/2, math.pi/2, math.pi/2, math.pi], dtype=torch.float64)
+SIGN1_DH = torch.tensor([[-1,1,-1,-1], [1,-1,1,1], [-1,1,-1,-1], [1,1,1,1]], dtype=torch.float64)
+SIGN2_DH = torch.tensor([[1,-1,-1,-1], [-1,1,1,1], [1,-1,-1,-1], [1,1,1,1]], dtype=torch.float64)
+SIGN3_DH = torch.tensor([[1,-1,1,-1], [-1,1,-1,1], [1,-1,1,-1], [1,1,1,1]], dtype=torch.float64)
+# Column permutation that swaps the y and z axes of a transform.
+COL_PERM_DH = torch.tensor([0, 2, 1, 3])
+
+# The robot model does not need double precision, so the torch FK runs in float32.
+FK_DTYPE = torch.float32
+
+# Maximum number of waypoints kept in the OpenRAVE forward kinematics cache.
+FK_CACHE_SIZE = 1000
+
+# Scaling of the xy axes that turns the proxemics distance into an ellipsis.
+PROXEMICS_SCALE = np.array([1.0, 1.0/3])
+
+
+# ---- Feature kernels ---- #
+
+def proximity_kernel(EE_coord_xy, object_xy, radius):
+	"""
+	Computes how far the end-effector is inside a circle around an object.
+	---
+	Params:
+		EE_coord_xy -- end-effector xy coords (2 or N x 2)
+		object_xy -- object xy coords (2)
+		radius -- radius of the circle
+	Returns:
+		dist -- 0 outside of the circle, the distance to its border inside (scalar or N)
+	"""
+	dist = np.linalg.norm(EE_coord_xy - object_xy, axis=-1) - radius
+	return np.maximum(0, -dist)
+
+def betweenobjects_kernel(EE_coord_xy, object1_xy, object2_xy):
+	"""
+	Computes how close the end-effector is to 2 objects and to the segment between them.
+	---
+	Params:
+		EE_coord_xy -- end-effector xy coords (2 or N x 2)
+		object1_xy, object2_xy -- object xy coords (2)
+	Returns:
+		dist -- 0 when more than 0.2 meters away, the distance within 0.2 meters otherwise (scalar or N)
+	"""
+	o1o2_xy = object2_xy - object1_xy
+	o1EE_xy = EE_coord_xy - object1_xy
+	o2EE_xy = EE_coord_xy - object2_xy
+	o1o2 = np.linalg.norm(o1o2_xy)
+
+	# The EE projects onto the segment between the objects iff both angles at
+	# the objects are acute, i.e. the dot products with the segment are positive.
+	between = ((o1EE_xy * o1o2_xy).sum(axis=-1) > 0) & ((o2EE_xy * o1o2_xy).sum(axis=-1) < 0)
+	cross = np.abs(o1o2_xy[0]*o1EE_xy[..., 1] - o1o2_xy[1]*o1EE_xy[..., 0])
+	dist1 = np.where(between, cross / o1o2 - 0.2, 0)
+	dist1 = 0.8*dist1 # control how much less it is to go between the objects versus on top of them
+	dist2 = np.minimum(np.linalg.norm(o1EE_xy, axis=-1), np.linalg.norm(o2EE_xy, axis=-1)) - 0.2
+
+	# 0 if both are positive, otherwise the negation of the smaller one.
+	return np.maximum(0, -np.minimum(dist1, dist2))
+
+# ---- Differentiable forward kinematics (TorchScript) ---- #
+
+@torch.jit.script
+def transform(theta, alpha, D):
+	# type: (Tensor, Tensor, Tensor) -> Tensor
+	"""
+	Manually compute a batch of link transforms given theta, alpha, and D (a is assumed to be 0).
+	"""
+	ct, st = torch.cos(theta), torch.sin(theta)
+	zero, one = torch.zeros_like(ct), torch.ones_like(ct)
+	ca, sa = one*torch.cos(alpha), one*torch.sin(alpha)
+	return torch.stack([
+		torch.stack([ct, -st*ca, st*sa, zero], dim=-1),
+		torch.stack([st, ct*ca, -ct*sa, zero], dim=-1),
+		torch.stack([zero, sa, ca, one*D], dim=-1),
+		torch.stack([zero, zero, zero, one], dim=-1)], dim=-2)
+
+@torch.jit.script
+def offset_z(T, R, dz):
+	# type: (Tensor, Tensor, Tensor) -> Tensor
+	"""
+	Turns a batch of transforms T = R*A into R*Trans_z(dz)*A, which is the
+	same as calling transform with D+dz for A, by moving the translation of T
+	by dz along the z-axis of its parent frame R.
+	"""
+	return torch.cat((T[:, :, :3], T[:, :, 3:] + dz*R[:, :, 2:3]), dim=2)
+
+@torch.jit.script
+def fk_all(waypt, D, e, alpha, sign1, sign2, sign3, col_perm):
+	# type: (Tensor, Tensor, Tensor, Tensor, Tensor, Tensor, Tensor, Tensor) -> Tensor
+	"""
+	Computes the transform of every joint for a batch of waypoints (B x 7),
+	returning a B x 7 x 4 x 4 tensor.
+	"""
+	waypt = waypt.t()
+	zero = torch.zeros_like(e[0])
+	base = torch.eye(4, dtype=waypt.dtype, device=waypt.device).unsqueeze(0)
+
+	# Now construct the list of transforms for all joints. Each link transform
+	# is computed once; the variants with a longer link distance are derived
+	# from it with offset_z instead of recomputing the link and the chain.
+
+	### T01 transform from base to joint 1 ###
+	T01 = transform(waypt[0], alpha[0], -D[0])
+	Tall = [T01.index_select(2, col_perm) * sign1]
+
+	### T02 transform from base to joint 2 ###
+	T01 = offset_z(T01, base, -D[1])
+	T12 = transform(waypt[1], alpha[1], -e[0])
+	T02 = torch.matmul(T01, T12)
+	Tall.append(T02.index_select(2, col_perm) * sign2)
+
+	### T03 transform from base to joint 3 ###
+	T23 = transform(waypt[2], alpha[2], -D[2])
+	T03 = torch.matmul(T02, T23)
+	Tall.append(T03.index_select(2, col_perm) * sign2)
+
+	### T04 transform from base to joint 4 ###
+	T03 = offset_z(T03, T02, -D[3])
+	T34 = transform(waypt[3], alpha[3], zero)
+	T04 = torch.matmul(T03, T34)
+	Tall.append(T04.index_select(2, col_perm) * sign1)
+
+	### T05 transform from base to joint 5 ###
+	T04 = offset_z(T04, T03, -(e[0]+e[1]))
+	T45 = transform(waypt[4], alpha[4], -D[4])
+	T05 = torch.matmul(T04, T45)
+	Tall.append(T05.index_select(2, col_perm) * sign2)
+
+	### T06 transform from base to joint 6 ###
+	T05 = offset_z(T05, T04, -D[5])
+	T56 = transform(waypt[5], alpha[5], zero)
+	T06 = torch.matmul(T05, T56)
+	Tall.append(T06.index_select(2, col_perm) * sign1)
+
+	### T07 transform from base to joint 7 ###
+	T67 = transform(waypt[6], alpha[6], -D[6])
+	T07 = torch.matmul(T06, T67)
+	Tall.append(T07 * sign3)
+
+	return torch.stack(Tall, dim=1)
+
 
 class Environment(object):
 	"""
 	This class creates an OpenRave environment and contains all the
 	functionality needed for custom features and constraints.
 	"""
-	def __init__(self, model_filename, object_centers, feat_list, feat_range, feat_weights, LF_dict=None, viewer=True):
+	def __init__(self, model_filename, object_centers, feat_list, feat_range, feat_weights, LF_dict=None, viewer=True, device='cpu'):
 		# ---- Create environment ---- #
 		self.env, self.robot = initialize(model_filename, viewer=viewer)
 		# creates environment in openrave
 
+		# Device for the torch FK and the learned features, with the DH parameters moved there once.
+		self.device = torch.device(device)
+		self._dh_params = tuple(param.to(self.device, FK_DTYPE) for param in (D_DH, E_DH, ALPHA_DH, SIGN1_DH, SIGN2_DH, SIGN3_DH))
+		self._dh_params += (COL_PERM_DH.to(self.device),)
+
 		# Insert any objects you want into environment.
 		self.bodies = []
 		self.object_centers = object_centers
@@ -29,29 +182,39 @@ class Environment(object):
 				plotLaptop(self.env, self.bodies, object_centers[center])
 			else:
 				plotSphere(self.env, self.bodies, object_centers[center], 0.015)
+		self.update_object_coords()
+
+		# Buffer for converting waypoints to OpenRAVE DOF values.
+		self._dof_buf = np.zeros(10)
+
+		# Cache of OpenRAVE forward kinematics results, keyed by DOF values.
+		self._fk_cache = {}
 
 		# Create the initial feature function list.
 		self.feature_func_list = []
 		self.feature_list = feat_list
 		self.num_features = len(self.feature_list)
 		self.feat_range = feat_range
+		# Precompute the normalizers as reciprocals, a range of 0 leaves the feature as is.
+		self._inv_feat_range = None
+		if feat_range is not None:
+			feat_range = np.asarray(feat_range, dtype=np.float64)
+			self._inv_feat_range = np.divide(1.0, feat_range, out=np.ones_like(feat_range), where=feat_range != 0)
+		# Feature functions by name: the single-waypoint function and its version
+		# vectorized over all waypoints of a trajectory.
+		feature_funcs = {'table': (self.table_features, self.table_features_batch),
+						 'coffee': (self.coffee_features, self.coffee_features_batch),
+						 'human': (self.human_features, self.human_features_batch),
+						 'laptop': (self.laptop_features, self.laptop_features_batch),
+						 'origin': (self.origin_features, self.origin_features_batch),
+						 'efficiency': (self.efficiency_features, self.efficiency_features_batch),
+						 'proxemics': (self.proxemics_features, self.proxemics_features_batch),
+						 'betweenobjects': (self.betweenobjects_features, self.betweenobjects_features_batch)}
 		for feat in self.feature_list:
-			if feat == 'table':
-				self.feature_func_list.append(self.table_features)
-			elif feat == 'coffee':
-				self.feature_func_list.append(self.coffee_features)
-			elif feat == 'human':
-				self.feature_func_list.append(self.human_features)
-			elif feat == 'laptop':
-				self.feature_func_list.append(self.laptop_features)
-			elif feat == 'origin':
-				self.feature_func_list.append(self.origin_features)
-			elif feat == 'efficiency':
-				self.feature_func_list.append(self.efficiency_features)
-			elif feat == 'proxemics':
-				self.feature_func_list.append(self.proxemics_features)
-			elif feat == 'betweenobjects':
-				self.feature_func_list.append(self.betweenobjects_features)
+			if feat in feature_funcs:
+				self.feature_func_list.append(feature_funcs[feat][0])
+		# featurize finds the vectorized version through the entry in feature_func_list.
+		self.feature_batch_funcs = dict(feature_funcs.values())
 
 		# Create a list of learned features.
 		self.learned_features = []
@@ -71,19 +234,45 @@ class Environment(object):
             waypts -- trajectory waypoints
             feat_idx -- list of feature indices (optional)
         Returns:
-            features -- list of feature values (T x num_features)
+            features -- array of feature values (num_features x T-1)
 		"""
 		# if no list of idx is provided use all of them
 		if feat_idx is None:
 			feat_idx = list(np.arange(self.num_features))
 
-		features = [[0.0 for _ in range(len(waypts)-1)] for _ in range(0, len(feat_idx))]
-		for index in range(len(waypts)-1):
-			for feat in range(len(feat_idx)):
-				waypt = waypts[index+1]
+		waypts = np.asarray(waypts)
+		if len(waypts) < 2:
+			# A single waypoint has no steps to evaluate.
+			return np.zeros((len(feat_idx), 0))
+		features = np.zeros((len(feat_idx), len(waypts)-1))
+		wp = waypts[1:].reshape(-1, 7)
+		EE_coords = EE_transforms = None
+		for feat in range(len(feat_idx)):
+			feat_func = self.feature_func_list[feat_idx[feat]]
+			batch_func = self.feature_batch_funcs.get(feat_func)
+			if self.feature_list[feat_idx[feat]] == 'learned_feature':
+				# Feed all raw_features to the NN at once.
+				features[feat] = feat_func(self.raw_features(wp))[:, 0]
+				continue
+			if batch_func == self.efficiency_features_batch:
+				features[feat] = batch_func(waypts)
+			elif batch_func is not None:
+				# The forward kinematics are computed once and shared by all features.
+				if EE_transforms is None:
+					coords, EE_transforms = self._batch_fk(wp)
+					EE_coords = coords[:, 6]
+				if batch_func == self.coffee_features_batch:
+					features[feat] = batch_func(EE_transforms)
+				else:
+					features[feat] = batch_func(EE_coords)
+			else:
+				# Other feature functions are evaluated one waypoint at a time.
 				if self.feature_list[feat_idx[feat]] == 'efficiency':
-					waypt = np.concatenate((waypts[index+1],waypts[index]))
-				features[feat][index] = self.featurize_single(waypt, feat_idx[feat])
+					features[feat] = [feat_func(np.concatenate((waypts[i+1], waypts[i]))) for i in range(len(wp))]
+				else:
+					features[feat] = [feat_func(waypt) for waypt in wp]
+			if self._inv_feat_range is not None and self._inv_feat_range[feat_idx[feat]] != 1.0:
+				features[feat] *= self._inv_feat_range[feat_idx[feat]]
 		return features
 
 	# -- Compute single feature for single waypoint -- #
@@ -105,119 +294,53 @@ class Environment(object):
 		if self.feature_list[feat_idx] == 'learned_feature':
 			featval = featval[0][0]
 		else:
-			if self.feat_range is not None:
-				featval /= self.feat_range[feat_idx]
+			if self._inv_feat_range is not None and self._inv_feat_range[feat_idx] != 1.0:
+				featval *= self._inv_feat_range[feat_idx]
 		return featval
 
 	# -- Return raw features -- #
 	def raw_features(self, waypt):
 		"""
-		Computes raw state space features for a given waypoint.
+		Computes raw state space features for a given waypoint or batch of waypoints.
 		---
         Params:
-            waypt -- single waypoint
+            waypt -- single waypoint (7) or batch of waypoints (B x 7)
         Returns:
-            raw_features -- list of raw feature values
+            raw_features -- list of raw feature values (97 or B x 97)
 		"""
-		object_coords = np.array([self.object_centers[x] for x in self.object_centers.keys()])
+		batched = len(waypt.shape) == 2 and waypt.shape[1] == 7
 		if torch.is_tensor(waypt):
-			Tall = self.get_torch_transforms(waypt)
-			coords = Tall[:,:3,3]
-			orientations = Tall[:,:3,:3]
-			object_coords = torch.from_numpy(object_coords)
-			return torch.reshape(torch.cat((waypt.squeeze(), orientations.flatten(), coords.flatten(), object_coords.flatten())), (-1,))
-		else:
-			if len(waypt) < 10:
-				waypt_openrave = np.append(waypt.reshape(7), np.array([0, 0, 0]))
-				waypt_openrave[2] += math.pi
-
-			self.robot.SetDOFValues(waypt_openrave)
-			coords = np.array(robotToCartesian(self.robot))
-			orientations = np.array(robotToOrientation(self.robot))
-			return np.reshape(np.concatenate((waypt.squeeze(), orientations.flatten(), coords.flatten(), object_coords.flatten())), (-1,))
+			# Build the whole batch with one FK pass and a single cat.
+			waypts = waypt.reshape(-1, 7).to(self.device, FK_DTYPE)
+			Tall = self.get_torch_transforms(waypts)
+			orientations = Tall[:,:,:3,:3].reshape(len(waypts), -1)
+			coords = Tall[:,:,:3,3].reshape(len(waypts), -1)
+			object_coords = self._object_coords_torch_flat.expand(len(waypts), -1)
+			raw = torch.cat((waypts, orientations, coords, object_coords), dim=1)
+			if not batched:
+				return raw[0]
+			return raw
+		if batched:
+			return np.array([self.raw_features(w) for w in waypt])
+		self.robot.SetDOFValues(self._to_openrave(waypt))
+		coords = np.array(robotToCartesian(self.robot))
+		orientations = np.array(robotToOrientation(self.robot))
+		return np.concatenate((waypt.squeeze(), orientations.reshape(-1), coords.reshape(-1), self._object_coords_flat_np))
 
 	def get_torch_transforms(self, waypt):
 		"""
-		Computes torch transforms for given waypoint.
+		Computes torch transforms for given waypoint or batch of waypoints.
 		---
         Params:
-            waypt -- single waypoint
+            waypt -- single waypoint (7) or batch of waypoints (B x 7)
         Returns:
-            Tall -- Transform in torch for every joint (7D)
-		"""
-		# Manually compute a link transform given theta, alpha, and D (a is assumed to be 0).
-		def transform(theta, alpha, D):
-			T = torch.zeros([4, 4])
-			T[0][0] = torch.cos(theta)
-			T[0][1] = -torch.sin(theta)*torch.cos(alpha)
-			T[0][2] = torch.sin(theta)*torch.sin(alpha)
-			T[1][0] = torch.sin(theta)
-			T[1][1] = torch.cos(theta)*torch.cos(alpha)
-			T[1][2] = -torch.cos(theta)*torch.sin(alpha)
-			T[2][1] = torch.sin(alpha)
-			T[2][2] = torch.cos(alpha)
-			T[2][3] = D
-			T[3][3] = 1.0
-			return T
-
-		def swap_cols(T, i, j):
-			return torch.cat((T[:, :i], T[:, j:j+1], T[:, i+1:j], T[:, i:i+1], T[:, j+1:]), dim=1)
-
-		# These are robot measurements and DH parameters.
-		# Ds are link distances. es are some minor joint displacement errors.
-		# For each transform, we much be careful which D and/or e we pass in.
-		# The manual is sort of correct about how to do this but not 100% right.
-		# Contact abobu@berkeley.edu if you have questions about this code.
-		e = torch.tensor(np.array([0.0016, 0.0098]), requires_grad=True)
-		D = torch.tensor(np.array([0.15675, 0.11875, 0.205, 0.205, 0.2073, 0.10375, 0.10375]), requires_grad=True)
-		alpha = torch.tensor(np.array([np.pi/2, np.pi/2, np.pi/2, np.pi/2, np.pi/2, np.pi/2, np.pi]), requires_grad=True)
-		sign1 = torch.tensor(np.array([[-1,1,-1,-1], [1,-1,1,1], [-1,1,-1,-1], [1,1,1,1]]), dtype=torch.float64, requires_grad=True)
-		sign2 = torch.tensor(np.array([[1,-1,-1,-1], [-1,1,1,1], [1,-1,-1,-1], [1,1,1,1]]), dtype=torch.float64, requires_grad=True)
-		sign3 = torch.tensor(np.array([[1,-1,1,-1], [-1,1,-1,1], [1,-1,1,-1], [1,1,1,1]]), dtype=torch.float64, requires_grad=True)
-
-		# Now construct the list of transforms for all joints.
-
-		### T01 transform from base to joint 1 ###
-		T01 = transform(waypt[0], alpha[0], -D[0])
-		Tall = (swap_cols(T01, 1, 2) * sign1).unsqueeze(0)
-
-		### T02 transform from base to joint 2 ###
-		T01 = transform(waypt[0], alpha[0], -(D[0]+D[1]))
-		T12 = transform(waypt[1], alpha[1], -e[0])
-		T02 = torch.matmul(T01, T12)
-		Tall = torch.cat((Tall, (swap_cols(T02, 1, 2) * sign2).unsqueeze(0)))
-
-		### T03 transform from base to joint 3 ###
-		T23 = transform(waypt[2], alpha[2], -D[2])
-		T03 = torch.matmul(T02, T23)
-		Tall = torch.cat((Tall, (swap_cols(T03, 1, 2) * sign2).unsqueeze(0)))
-
-		### T04 transform from base to joint 4 ###
-		T23 = transform(waypt[2], alpha[2], -(D[2]+D[3]))
-		T34 = transform(waypt[3], alpha[3], 0.0)
-		T03 = torch.matmul(T02, T23)
-		T04 = torch.matmul(T03, T34)
-		Tall = torch.cat((Tall, (swap_cols(T04, 1, 2) * sign1).unsqueeze(0)))
-
-		### T05 transform from base to joint 5 ###
-		T34 = transform(waypt[3], alpha[3], -(e[0]+e[1]))
-		T45 = transform(waypt[4], alpha[4], -D[4])
-		T04 = torch.matmul(T03, T34)
-		T05 = torch.matmul(T04, T45)
-		Tall = torch.cat((Tall, (swap_cols(T05, 1, 2) * sign2).unsqueeze(0)))
-
-		### T06 transform from base to joint 6 ###
-		T45 = transform(waypt[4], alpha[4], -(D[4]+D[5]))
-		T56 = transform(waypt[5], alpha[5], 0.0)
-		T05 = torch.matmul(T04, T45)
-		T06 = torch.matmul(T05, T56)
-		Tall = torch.cat((Tall, (swap_cols(T06, 1, 2) * sign1).unsqueeze(0)))
-
-		### T07 transform from base to joint 7 ###
-		T67 = transform(waypt[6], alpha[6], -D[6])
-		T07 = torch.matmul(T06, T67)
-		Tall = torch.cat((Tall, (T07 * sign3).unsqueeze(0)))
-
+            Tall -- Transform in torch for every joint (7 x 4 x 4 or B x 7 x 4 x 4),
+                    on self.device in FK_DTYPE
+		"""
+		batched = len(waypt.shape) == 2 and waypt.shape[1] == 7
+		Tall = fk_all(waypt.reshape(-1, 7).to(self.device, FK_DTYPE), *self._dh_params)
+		if not batched:
+			return Tall[0]
 		return Tall
 
 	# -- Instantiate a new learned feature -- #
@@ -231,7 +354,7 @@ class Environment(object):
             nb_units -- number of NN units per layer
             checkpoint_name -- name of NN model to load (optional)
         """
-		self.learned_features.append(LearnedFeature(nb_layers, nb_units, self.LF_dict))
+		self.learned_features.append(LearnedFeature(nb_layers, nb_units, self.LF_dict, self.device))
 		self.feature_list.append('learned_feature')
 		self.num_features += 1
 		# initialize new feature weight with zero
@@ -240,7 +363,8 @@ class Environment(object):
 		# If we can, load a model instead of a blank feature.
 		if checkpoint_name is not None:
 			here = os.path.abspath(os.path.join(os.path.dirname( __file__ ), '../../'))
-			self.learned_features[-1] = torch.load(here+'/data/final_models/' + checkpoint_name)
+			self.learned_features[-1] = torch.load(here+'/data/final_models/' + checkpoint_name, map_location=self.device)
+			self.learned_features[-1].to(self.device)
 
 		self.feature_func_list.append(self.learned_features[-1].function)
 
@@ -256,7 +380,20 @@ class Environment(object):
             dist -- scalar feature
 		"""
 
-		return np.linalg.norm(waypt[:7] - waypt[7:])**2
+		d = waypt[:7] - waypt[7:]
+		return d.dot(d)
+
+	def efficiency_features_batch(self, waypts):
+		"""
+		Computes efficiency feature for all consecutive waypoint pairs at once.
+		---
+        Params:
+            waypts -- trajectory waypoints (T x 7)
+        Returns:
+            dist -- array of feature values (T-1)
+		"""
+		d = waypts[1:].reshape(-1, 7) - waypts[:-1].reshape(-1, 7)
+		return np.einsum('ij,ij->i', d, d)
 
 	# -- Distance to Robot Base (origin of world) -- #
 
@@ -270,14 +407,19 @@ class Environment(object):
         Returns:
             dist -- scalar feature
 		"""
-		if len(waypt) < 10:
-			waypt = np.append(waypt.reshape(7), np.array([0,0,0]))
-			waypt[2] += math.pi
-		self.robot.SetDOFValues(waypt)
-		coords = robotToCartesian(self.robot)
-		EEcoord_y = coords[6][1]
-		EEcoord_y = np.linalg.norm(coords[6])
-		return EEcoord_y
+		coords, _ = self._fk(waypt)
+		return np.linalg.norm(coords[6])
+
+	def origin_features_batch(self, EE_coords):
+		"""
+		Computes the distance from end-effector to the robot base for a
+		batch of waypoints at once.
+        Params:
+            EE_coords -- end-effector coords of the waypoints (N x 3)
+        Returns:
+            dist -- array of distances (N)
+		"""
+		return np.linalg.norm(EE_coords, axis=1)
 
 	# -- Distance to Table -- #
 
@@ -291,14 +433,21 @@ class Environment(object):
         Returns:
             dist -- scalar feature
 		"""
-		if len(waypt) < 10:
-			waypt = np.append(waypt.reshape(7), np.array([0,0,0]))
-			waypt[2] += math.pi
-		self.robot.SetDOFValues(waypt)
-		coords = robotToCartesian(self.robot)
+		coords, _ = self._fk(waypt)
 		EEcoord_z = coords[6][2]
 		return EEcoord_z
 
+	def table_features_batch(self, EE_coords):
+		"""
+		Computes the end-effector height above the table for a batch of
+		waypoints at once.
+        Params:
+            EE_coords -- end-effector coords of the waypoints (N x 3)
+        Returns:
+            dist -- array of z coords (N)
+		"""
+		return EE_coords[:, 2]
+
 	# -- Coffee (or z-orientation of end-effector) -- #
 
 	def coffee_features(self, waypt):
@@ -311,14 +460,19 @@ class Environment(object):
         Returns:
             dist -- scalar feature
 		"""
-		if len(waypt) < 10:
-			waypt = np.append(waypt.reshape(7), np.array([0,0,0]))
-			waypt[2] += math.pi
+		_, EE_transform = self._fk(waypt)
+		return 1 - EE_transform[:3,0].dot([0,0,1])
 
-		self.robot.SetDOFValues(waypt)
-		EE_link = self.robot.GetLinks()[7]
-		Rx = EE_link.GetTransform()[:3,0]
-		return 1 - EE_link.GetTransform()[:3,0].dot([0,0,1])
+	def coffee_features_batch(self, EE_transforms):
+		"""
+		Computes the coffee orientation feature for a batch of waypoints at
+		once, by checking if the EE is oriented vertically.
+        Params:
+            EE_transforms -- end-effector transforms of the waypoints (N x 4 x 4)
+        Returns:
+            dist -- array of feature values (N)
+		"""
+		return 1 - EE_transforms[:, 2, 0]
 
 	# -- Distance to Laptop -- #
 
@@ -332,17 +486,22 @@ class Environment(object):
                 0: EE is at more than 0.3 meters away from laptop
                 +: EE is closer than 0.3 meters to laptop
 		"""
-		if len(waypt) < 10:
-			waypt = np.append(waypt.reshape(7), np.array([0,0,0]))
-			waypt[2] += math.pi
-		self.robot.SetDOFValues(waypt)
-		coords = robotToCartesian(self.robot)
-		EE_coord_xy = coords[6][0:2]
+		coords, _ = self._fk(waypt)
 		laptop_xy = np.array(self.object_centers['LAPTOP_CENTER'][0:2])
-		dist = np.linalg.norm(EE_coord_xy - laptop_xy) - 0.3
-		if dist > 0:
-			return 0
-		return -dist
+		return proximity_kernel(coords[6][0:2], laptop_xy, 0.3)
+
+	def laptop_features_batch(self, EE_coords):
+		"""
+		Computes distance from end-effector to laptop in xy coords for a
+		batch of waypoints at once.
+        Params:
+            EE_coords -- end-effector coords of the waypoints (N x 3)
+        Returns:
+            dist -- array of distances (N), 0 where the EE is more than
+                    0.3 meters away from the laptop
+		"""
+		laptop_xy = np.array(self.object_centers['LAPTOP_CENTER'][0:2])
+		return proximity_kernel(EE_coords[:, 0:2], laptop_xy, 0.3)
 
 	# -- Distance to Human -- #
 
@@ -356,17 +515,22 @@ class Environment(object):
                 0: EE is at more than 0.4 meters away from human
                 +: EE is closer than 0.4 meters to human
 		"""
-		if len(waypt) < 10:
-			waypt = np.append(waypt.reshape(7), np.array([0,0,0]))
-			waypt[2] += math.pi
-		self.robot.SetDOFValues(waypt)
-		coords = robotToCartesian(self.robot)
-		EE_coord_xy = coords[6][0:2]
+		coords, _ = self._fk(waypt)
 		human_xy = np.array(self.object_centers['HUMAN_CENTER'][0:2])
-		dist = np.linalg.norm(EE_coord_xy - human_xy) - 0.4
-		if dist > 0:
-			return 0
-		return -dist
+		return proximity_kernel(coords[6][0:2], human_xy, 0.4)
+
+	def human_features_batch(self, EE_coords):
+		"""
+		Computes distance from end-effector to human in xy coords for a
+		batch of waypoints at once.
+        Params:
+            EE_coords -- end-effector coords of the waypoints (N x 3)
+        Returns:
+            dist -- array of distances (N), 0 where the EE is more than
+                    0.4 meters away from the human
+		"""
+		human_xy = np.array(self.object_centers['HUMAN_CENTER'][0:2])
+		return proximity_kernel(EE_coords[:, 0:2], human_xy, 0.4)
 
 	# -- Human Proxemics -- #
 
@@ -380,20 +544,23 @@ class Environment(object):
                 0: EE is at more than 0.3 meters away from human
                 +: EE is closer than 0.3 meters to human
 		"""
-		if len(waypt) < 10:
-			waypt = np.append(waypt.reshape(7), np.array([0,0,0]))
-			waypt[2] += math.pi
-		self.robot.SetDOFValues(waypt)
-		coords = robotToCartesian(self.robot)
-		EE_coord_xy = coords[6][0:2]
+		coords, _ = self._fk(waypt)
 		human_xy = np.array(self.object_centers['HUMAN_CENTER'][0:2])
 		# Modify ellipsis distance.
-		EE_coord_xy[1] /= 3
-		human_xy[1] /= 3
-		dist = np.linalg.norm(EE_coord_xy - human_xy) - 0.3
-		if dist > 0:
-			return 0
-		return -dist
+		return proximity_kernel(coords[6][0:2] * PROXEMICS_SCALE, human_xy * PROXEMICS_SCALE, 0.3)
+
+	def proxemics_features_batch(self, EE_coords):
+		"""
+		Computes distance from end-effector to human proxemics in xy coords
+		for a batch of waypoints at once.
+        Params:
+            EE_coords -- end-effector coords of the waypoints (N x 3)
+        Returns:
+            dist -- array of distances (N), 0 where the EE is outside the
+                    proxemics ellipsis around the human
+		"""
+		human_xy = np.array(self.object_centers['HUMAN_CENTER'][0:2])
+		return proximity_kernel(EE_coords[:, 0:2] * PROXEMICS_SCALE, human_xy * PROXEMICS_SCALE, 0.3)
 
 	# -- Between 2-objects -- #
 
@@ -407,35 +574,24 @@ class Environment(object):
 			    0: EE is at more than 0.2 meters away from the objects and between
 			    +: EE is closer than 0.2 meters to the objects and between
 		"""
-		if len(waypt) < 10:
-			waypt = np.append(waypt.reshape(7), np.array([0,0,0]))
-			waypt[2] += math.pi
-		self.robot.SetDOFValues(waypt)
-		coords = robotToCartesian(self.robot)
-		EE_coord_xy = coords[6][0:2]
+		coords, _ = self._fk(waypt)
 		object1_xy = np.array(self.object_centers['OBJECT1'][0:2])
 		object2_xy = np.array(self.object_centers['OBJECT2'][0:2])
+		return betweenobjects_kernel(coords[6][0:2], object1_xy, object2_xy)
 
-		# Determine where the point lies with respect to the segment between the two objects.
-		o1EE = np.linalg.norm(object1_xy - EE_coord_xy)
-		o2EE = np.linalg.norm(object2_xy - EE_coord_xy)
-		o1o2 = np.linalg.norm(object1_xy - object2_xy)
-		o1angle = np.arccos((o1EE**2 + o1o2**2 - o2EE**2) / (2*o1o2*o1EE))
-		o2angle = np.arccos((o2EE**2 + o1o2**2 - o1EE**2) / (2*o1o2*o2EE))
-
-		dist1 = 0
-		if o1angle < np.pi/2 and o2angle < np.pi/2:
-			dist1 = np.linalg.norm(np.cross(object2_xy - object1_xy, object1_xy - EE_coord_xy)) / o1o2 - 0.2
-		dist1 = 0.8*dist1 # control how much less it is to go between the objects versus on top of them
-		dist2 = min(np.linalg.norm(object1_xy - EE_coord_xy), np.linalg.norm(object2_xy - EE_coord_xy)) - 0.2
-
-		if dist1 > 0 and dist2 > 0:
-			return 0
-		elif dist2 > 0:
-			return -dist1
-		elif dist1 > 0:
-			return -dist2
-		return -min(dist1, dist2)
+	def betweenobjects_features_batch(self, EE_coords):
+		"""
+		Computes distance from end-effector to 2 objects in xy coords for a
+		batch of waypoints at once.
+        Params:
+            EE_coords -- end-effector coords of the waypoints (N x 3)
+        Returns:
+            dist -- array of distances (N), 0 where the EE is more than
+                    0.2 meters away from the objects and between
+		"""
+		object1_xy = np.array(self.object_centers['OBJECT1'][0:2])
+		object2_xy = np.array(self.object_centers['OBJECT2'][0:2])
+		return betweenobjects_kernel(EE_coords[:, 0:2], object1_xy, object2_xy)
 
 	# ---- Custom environmental constraints --- #
 
@@ -443,10 +599,7 @@ class Environment(object):
 		"""
 		Constrains z-axis of robot's end-effector to always be above the table.
 		"""
-		if len(waypt) < 10:
-			waypt = np.append(waypt.reshape(7), np.array([0,0,0]))
-			waypt[2] += math.pi
-		self.robot.SetDOFValues(waypt)
+		self.robot.SetDOFValues(self._to_openrave(waypt))
 		EE_link = self.robot.GetLinks()[10]
 		EE_coord_z = EE_link.GetTransform()[2][3]
 		if EE_coord_z > -0.1016:
@@ -457,10 +610,7 @@ class Environment(object):
 		"""
 		Constrains orientation of robot's end-effector to be holding coffee mug upright.
 		"""
-		if len(waypt) < 10:
-			waypt = np.append(waypt.reshape(7), np.array([0,0,0]))
-			waypt[2] += math.pi
-		self.robot.SetDOFValues(waypt)
+		self.robot.SetDOFValues(self._to_openrave(waypt))
 		EE_link = self.robot.GetLinks()[7]
 		return EE_link.GetTransform()[:2,:3].dot([1,0,0])
 
@@ -468,15 +618,73 @@ class Environment(object):
 		"""
 		Analytic derivative for coffee constraint.
 		"""
-		if len(waypt) < 10:
-			waypt = np.append(waypt.reshape(7), np.array([0,0,0]))
-			waypt[2] += math.pi
-		self.robot.SetDOFValues(waypt)
+		self.robot.SetDOFValues(self._to_openrave(waypt))
 		world_dir = self.robot.GetLinks()[7].GetTransform()[:3,:3].dot([1,0,0])
-		return np.array([np.cross(self.robot.GetJoints()[i].GetAxis(), world_dir)[:2] for i in range(7)]).T.copy()
+		axes = np.array([joint.GetAxis() for joint in self.robot.GetJoints()[:7]])
+		# Copy so trajopt gets a contiguous 2 x 7 array.
+		return np.cross(axes, world_dir)[:, :2].T.copy()
 
 	# ---- Helper functions ---- #
 
+	def update_object_coords(self):
+		"""
+		Caches the object centers as arrays for raw_features. Needs to be
+		called again whenever object_centers is modified.
+		"""
+		self._object_coords_np = np.array(list(self.object_centers.values()), dtype=np.float64)
+		self._object_coords_flat_np = self._object_coords_np.ravel()
+		self._object_coords_torch = torch.from_numpy(self._object_coords_np).to(self.device, FK_DTYPE)
+		self._object_coords_torch_flat = self._object_coords_torch.reshape(-1)
+
+	def _to_openrave(self, waypt):
+		"""
+		Converts a 7D waypoint to the 10 OpenRAVE DOF values, written into a
+		buffer that is reused across calls. Waypoints that already have 10
+		DOFs are returned as they are.
+		"""
+		if len(waypt) < 10:
+			self._dof_buf[:7] = waypt.reshape(7)
+			self._dof_buf[2] += math.pi
+			return self._dof_buf
+		return waypt
+
+	def _prime_fk(self, waypt):
+		"""
+		Runs OpenRAVE forward kinematics for a waypoint and caches the link
+		coordinates (7 x 3) and the end-effector transform (4 x 4).
+		"""
+		dofs = self._to_openrave(waypt)
+		self.robot.SetDOFValues(dofs)
+		coords = np.array(robotToCartesian(self.robot))
+		EE_transform = self.robot.GetLinks()[7].GetTransform()
+		# Cached arrays are shared between features, so guard against in-place edits.
+		coords.flags.writeable = False
+		EE_transform.flags.writeable = False
+		if len(self._fk_cache) >= FK_CACHE_SIZE:
+			self._fk_cache.clear()
+		self._fk_cache[dofs.tobytes()] = (coords, EE_transform)
+		return coords, EE_transform
+
+	def _fk(self, waypt):
+		"""
+		Returns the link coordinates and end-effector transform for a
+		waypoint, only running OpenRAVE forward kinematics on a cache miss.
+		"""
+		fk = self._fk_cache.get(self._to_openrave(waypt).tobytes())
+		if fk is None:
+			fk = self._prime_fk(waypt)
+		return fk
+
+	def _batch_fk(self, waypts):
+		"""
+		Returns the stacked link coordinates (N x 7 x 3) and end-effector
+		transforms (N x 4 x 4) for a batch of waypoints (N x 7).
+		"""
+		if len(waypts) == 0:
+			return np.empty((0, 7, 3)), np.empty((0, 4, 4))
+		fks = [self._fk(waypt) for waypt in waypts]
+		return np.array([fk[0] for fk in fks]), np.array([fk[1] for fk in fks])
+
 	def update_curr_pos(self, curr_pos):
 		"""
 		Updates DOF values in OpenRAVE simulation based on curr_pos.
@@ -230,6 +230,7 @@ def generate_gt_data(feature):
 					 "L29": [-0.4, 0.3, 0.0], "L30": [-0.6, 0.3, 0.0]}
 		for lidx in positions.keys():
 			environment.object_centers["LAPTOP_CENTER"] = positions[lidx]
+			environment.update_object_coords()
 			train, labels = sample_data(environment, "laptop")
 			# Create raw features
 			train_raw = np.empty((0, 97), float)
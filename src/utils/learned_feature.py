@@ -19,6 +19,7 @@ class LearnedFeature(object):
 	nb_units	number of hidden units per layer for the NN
 
 	LF_dict		dict containing all settings for the learned feature, example see below
+	device		torch device the NNs are evaluated & trained on (optional)
 
 	LF_dict = {'bet_data':5, 'sin':False, 'cos':False, 'rpy':False, 'lowdim':False, 'norot':True,
            'noangles':True, '6D_laptop':False, '6D_human':False, '9D_coffee':False, 'EErot':False,
@@ -34,7 +35,7 @@ class LearnedFeature(object):
 	9D_coffee			: only the 9 entries of the Endeffector rotation matrix as input
 	6D_laptop, 6D_human	: only the endeffector xyz plus the xyz of the laptop or the human is used as input space
 	"""
-	def __init__(self, nb_layers, nb_units, LF_dict):
+	def __init__(self, nb_layers, nb_units, LF_dict, device='cpu'):
 
 		self.trace_list = []
 		self.full_data_array = np.empty((0, 5), float)
@@ -45,6 +46,7 @@ class LearnedFeature(object):
 		self.min_labels = [0 for _ in range(len(self.subspaces_list))]
 		self.LF_dict = LF_dict
 		self.models = []
+		self.device = torch.device(device)
 
 		# set default
 		self.final_model = 0
@@ -52,9 +54,18 @@ class LearnedFeature(object):
 		# ---- Initialize Function approximators for each subspace ---- #
 		if self.LF_dict['subspace_heuristic']:
 			for sub_range in self.subspaces_list:
-				self.models.append(DNN(nb_layers, nb_units, sub_range[1] - sub_range[0]))
+				self.models.append(DNN(nb_layers, nb_units, sub_range[1] - sub_range[0]).to(self.device))
 		else:
-			self.models.append(DNN(nb_layers, nb_units, self.subspaces_list[-1][1]))
+			self.models.append(DNN(nb_layers, nb_units, self.subspaces_list[-1][1]).to(self.device))
+
+	def to(self, device):
+		"""
+			Moves the function approximators to device, inputs are moved there on evaluation.
+		"""
+		self.device = torch.device(device)
+		for model in self.models:
+			model.to(self.device)
+		return self
 
 	def function(self, x, model=None, torchify=False, norm=False):
 		"""
@@ -90,7 +101,7 @@ class LearnedFeature(object):
 			if torchify:
 				return y
 			else:
-				return np.array(y.detach())
+				return np.array(y.detach().cpu())
 		else:
 			return y
 
@@ -100,6 +111,7 @@ class LearnedFeature(object):
 		"""
 		if not torch.is_tensor(x):
 			x = torch.Tensor(x)
+		x = x.to(self.device)
 		if len(x.shape) == 1:
 			x = torch.unsqueeze(x, axis=0)
 		return x
@@ -270,8 +282,8 @@ class LearnedFeature(object):
 		"""
 		s_0s_array = np.array([tup[0] for tup in self.full_data_array]).squeeze()
 		s_1s_array = np.array([tup[1] for tup in self.full_data_array]).squeeze()
-		s0_logits = self.function(s_0s_array, model=model_idx).view(-1).detach()
-		s1_logits = self.function(s_1s_array, model=model_idx).view(-1).detach()
+		s0_logits = self.function(s_0s_array, model=model_idx).view(-1).detach().cpu()
+		s1_logits = self.function(s_1s_array, model=model_idx).view(-1).detach().cpu()
 		all_logits = np.vstack((s0_logits, s1_logits))
 		self.max_labels[model_idx] = np.amax(all_logits)
 		self.min_labels[model_idx] = np.amin(all_logits)
@@ -292,14 +304,14 @@ class LearnedFeature(object):
 		s_2s_array = batch['s2']
 
 		# arrays of the start & end labels
-		delta_1s_array = batch['l1']
-		delta_2s_array = batch['l2']
+		delta_1s_array = batch['l1'].to(self.device)
+		delta_2s_array = batch['l2'].to(self.device)
 
 		# label for classifiers
-		labels = batch['label']
+		labels = batch['label'].to(self.device)
 
-		weights = torch.ones(labels.shape)
-		weights = weights + (labels == 0.5)*torch.full(labels.shape, s_g_weight)
+		weights = torch.ones(labels.shape, device=self.device)
+		weights = weights + (labels == 0.5)*torch.full(labels.shape, s_g_weight, device=self.device)
 
 		s1_adds = (delta_1s_array * (self.max_labels[model_idx] - self.min_labels[model_idx])).reshape(-1,1)
 		s2_adds = (delta_2s_array * (self.max_labels[model_idx] - self.min_labels[model_idx])).reshape(-1, 1)
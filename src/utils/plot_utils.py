@@ -80,12 +80,12 @@ def get_coords_gt_cost(expert_env, parent_dir, gen=False, n_waypoints=10000):
 
 	# generate gt_labels
 	feat_idx = list(np.arange(expert_env.num_features))
-	features = [[0.0 for _ in range(len(raw_waypts))] for _ in range(0, len(expert_env.feature_list))]
+	features = np.empty((len(feat_idx), len(raw_waypts)), dtype=np.float64)
 	for index in range(len(raw_waypts)):
 		for feat in range(len(feat_idx)):
-			features[feat][index] = expert_env.featurize_single(raw_waypts[index,:7], feat_idx[feat])
+			features[feat, index] = expert_env.featurize_single(raw_waypts[index,:7], feat_idx[feat])
 
-	features = np.array(features).T
+	features = features.T
 	gt_cost = np.matmul(features, np.array(expert_env.weights).reshape(-1,1))
 
 	return raw_waypts, gt_cost
@@ -28,7 +28,7 @@ def transform_input(x, trans_dict):
 	if trans_dict['9D_coffee']:
 		return x[:, 61:70]
 
-	x_transform = torch.empty((x.shape[0], 0), requires_grad=True, dtype=torch.float32)
+	x_transform = torch.empty((x.shape[0], 0), requires_grad=True, dtype=torch.float32, device=x.device)
 
 	# angles instead of radians use sin or cos
 	if not trans_dict['noangles']: